@@ -1,21 +1,96 @@
 #!/usr/bin/env python3
 
 import fileinput
+import math
+import os
 from pprint import pprint
 
+from collections import defaultdict
+
 import numpy as np
 
+# "recursive" builds the difference pyramid per sequence;
+# "binomial" extrapolates all sequences of a length with one matrix-vector product;
+# "stream" builds each pyramid once per input line, holding only running sums.
+ENGINE = os.environ.get("ENGINE", "recursive")
+
 def main():
+    if ENGINE == "stream":
+        s = 0
+        r = 0
+        for line in fileinput.input():
+            if line.strip():
+                nxt, prev = extrapolate_both([int(n) for n in line.split()])
+                s += nxt
+                r += prev
+        print("Part 1:", s)
+        print("Part 2:", r)
+        return
+
     data = []
     for line in fileinput.input():
         data.append([int(n) for n in line.split()])
 
+    if ENGINE == "binomial":
+        s, r = batch_predict(data)
+        print("Part 1:", s)
+        print("Part 2:", r)
+        return
+
     s = sum(predict(seq) for seq in data)
     print("Part 1:", s)
 
     r = sum(rpredict(seq) for seq in data)
     print("Part 2:", r)
 
+def extrapolate_both(x):
+    """Returns (next value, previous value) of x from one difference pyramid.
+
+    The next value is the sum of the last entries of the levels and the previous one is
+    the alternating sum of the first entries.  x is differenced in place.
+    """
+    nxt = 0
+    prev = 0
+    sign = 1
+    while True:
+        nxt += x[-1]
+        prev += sign * x[0]
+        sign = -sign
+        if all(a == x[0] for a in x):
+            return nxt, prev
+        for i in range(len(x) - 1):
+            x[i] = x[i + 1] - x[i]
+        x.pop()
+
+def extrapolation_weights(n):
+    """Integer weights giving the next and previous values of a length-n sequence.
+
+    The n-th differences of the extended sequence are zero, so
+    x[n] = sum((-1)**(n-1-k) * C(n, k) * x[k]) and x[-1] = sum((-1)**k * C(n, k+1) * x[k]).
+    """
+    next_w = [(-1) ** (n - 1 - k) * math.comb(n, k) for k in range(n)]
+    prev_w = [(-1) ** k * math.comb(n, k + 1) for k in range(n)]
+    return next_w, prev_w
+
+def batch_predict(data):
+    """Returns (sum of next values, sum of previous values) over all sequences."""
+    by_len = defaultdict(list)
+    for seq in data:
+        by_len[len(seq)].append(seq)
+
+    s = 0
+    r = 0
+    for n, seqs in by_len.items():
+        next_w, prev_w = extrapolation_weights(n)
+        # The weights reach 2**n and each weighted sum is at most 2**n * max|x| in
+        # magnitude; past int64, use Python ints.
+        max_abs = max(abs(x) for seq in seqs for x in seq)
+        dtype = np.int64 if (max(max_abs, 1) << n) < 2**63 else object
+        a = np.array(seqs, dtype=dtype)
+        s += sum((a @ np.array(next_w, dtype=dtype)).tolist())
+        r += sum((a @ np.array(prev_w, dtype=dtype)).tolist())
+    return s, r
+
 def predict(seq):
     r = apredict(np.array(seq))
     return r
@@ -1,14 +1,36 @@
 #!/usr/bin/env python3
 
 import fileinput
+import multiprocessing
 import os
+import re
+import sqlite3
+import sys
+import time
 from pprint import pprint
 
 import functools
 import itertools
+from collections import defaultdict
 
 DEBUG = os.environ.get("DEBUG")
 
+# "memo" recurses with an lru_cache per record; "dp" tabulates bottom-up in shared buffers;
+# "transfer" composes a per-copy transition by repeated squaring instead of unfolding.
+ENGINE = os.environ.get("ENGINE", "memo")
+
+FOLD_FACTOR = int(os.environ.get("FOLD", "5"))
+
+# Number of processes to shard the records over; 1 counts them serially.
+WORKERS = int(os.environ.get("WORKERS", "1"))
+
+# Report this many of the slowest records for each part.
+SLOWEST = int(os.environ.get("SLOWEST", "0"))
+
+# sqlite file to persist counts in across runs, keeping the CACHE_SIZE most recently used.
+CACHE = os.environ.get("CACHE")
+CACHE_SIZE = int(os.environ.get("CACHE_SIZE", "100000"))
+
 def main():
     records = []
     for line in fileinput.input():
@@ -16,17 +38,143 @@ def main():
         groups = list(map(int, g.split(",")))
         records.append((conditions, groups))
 
-    print("Part 1:", arrangements(records))
+    if ENGINE == "transfer":
+        # Counts for large fold factors can run to more digits than str() allows by default.
+        if hasattr(sys, "set_int_max_str_digits"):
+            sys.set_int_max_str_digits(0)
+        parts = [(records, 1, functools.partial(arrangements_transfer, fold_factor=1)),
+                 (records, FOLD_FACTOR,
+                  functools.partial(arrangements_transfer, fold_factor=FOLD_FACTOR))]
+    else:
+        count = arrangements_dp if ENGINE == "dp" else arrangements
 
-    FOLD_FACTOR = 5
-    unfolded_records = []
-    for conditions, groups in records:
-        ucond = "?".join(itertools.repeat(conditions, FOLD_FACTOR))
-        ugroups = groups * FOLD_FACTOR
-        unfolded_records.append((ucond, ugroups))
+        unfolded_records = []
+        for conditions, groups in records:
+            ucond = "?".join(itertools.repeat(conditions, FOLD_FACTOR))
+            ugroups = groups * FOLD_FACTOR
+            unfolded_records.append((ucond, ugroups))
+
+        parts = [(records, 1, count), (unfolded_records, FOLD_FACTOR, count)]
+
+    cache = ArrangementCache(CACHE, CACHE_SIZE) if CACHE else None
+
+    for part, (part_records, fold_factor, count) in enumerate(parts, 1):
+        s = 0
+        todo = range(len(part_records))
+        if cache:
+            keys = [cache_key(record, fold_factor) for record in records]
+            todo = []
+            for k, key in enumerate(keys):
+                ways = cache.get(key)
+                if ways is None:
+                    todo.append(k)
+                else:
+                    s += ways
+
+        if WORKERS > 1 or SLOWEST or cache:
+            ss, timings = sharded_arrangements([part_records[k] for k in todo], count, WORKERS)
+            s += ss
+            timings = [(todo[i], m, seconds) for i, m, seconds in timings]
+            if cache:
+                for k, m, _ in timings:
+                    cache.put(keys[k], m)
+                # Keep this part's counts even if a later one is interrupted.
+                cache.commit()
+            timings.sort(key=lambda t: t[2], reverse=True)
+            for k, m, seconds in timings[:SLOWEST]:
+                print(f"  {seconds:.3f}s record {k + 1}: {m} ways", *records[k])
+        else:
+            s = count(part_records)
+        print(f"Part {part}:", s)
+
+    if cache:
+        cache.close()
+        print(f"Cache: {cache.hits} hits, {cache.misses} misses")
+
+def cache_key(record, fold_factor):
+    """Runs of '.' are equivalent to a single '.', even across the joints of unfolding."""
+    conditions, groups = record
+    conditions = re.sub(r"\.+", ".", conditions)
+    return f"{conditions} {','.join(map(str, groups))} x{fold_factor}"
+
+class ArrangementCache:
+    """Arrangement counts persisted in a sqlite file, evicting the least recently used
+    entries beyond max_entries on each commit."""
+
+    def __init__(self, path, max_entries):
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS counts"
+                        " (key TEXT PRIMARY KEY, ways TEXT NOT NULL, used INTEGER NOT NULL)")
+        self.max_entries = max_entries
+        self.clock = self.db.execute("SELECT MAX(used) FROM counts").fetchone()[0] or 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        row = self.db.execute("SELECT ways FROM counts WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.clock += 1
+        self.db.execute("UPDATE counts SET used = ? WHERE key = ?", (self.clock, key))
+        # Counts can outgrow sqlite's 64-bit integers.
+        return int(row[0])
+
+    def put(self, key, ways):
+        self.clock += 1
+        self.db.execute("INSERT OR REPLACE INTO counts VALUES (?, ?, ?)",
+                        (key, str(ways), self.clock))
+
+    def commit(self):
+        with self.db:
+            self.db.execute("DELETE FROM counts WHERE key NOT IN"
+                            " (SELECT key FROM counts ORDER BY used DESC LIMIT ?)",
+                            (self.max_entries,))
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+def _count_chunk(count, chunk):
+    """Returns (sum, [(record index, ways, seconds)]) for a chunk of (index, record) pairs."""
+    s = 0
+    timings = []
+    for k, record in chunk:
+        t = time.perf_counter()
+        m = count([record])
+        timings.append((k, m, time.perf_counter() - t))
+        s += m
+    return s, timings
+
+def sharded_arrangements(records, count, workers):
+    """Counts the records in a process pool; returns (sum, per-record timings in input order).
+
+    Records are split into contiguous chunks of roughly equal estimated cost (conditions
+    length times number of groups), several per worker, so one long unfolded record
+    doesn't leave the other workers idle.
+    """
+    costs = [len(conditions) * (len(groups) + 1) for conditions, groups in records]
+    target = sum(costs) / (max(workers, 1) * 4) or 1
+    chunks = [[]]
+    acc = 0
+    for k, record in enumerate(records):
+        if acc >= target:
+            chunks.append([])
+            acc = 0
+        chunks[-1].append((k, record))
+        acc += costs[k]
+
+    if workers <= 1:
+        results = [_count_chunk(count, chunk) for chunk in chunks]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.starmap(_count_chunk, [(count, chunk) for chunk in chunks])
+
+    s = sum(r[0] for r in results)
+    timings = [t for r in results for t in r[1]]
+    return s, timings
 
-    print("Part 2:", arrangements(unfolded_records))
-    
 def arrangements(records):
     s = 0
     for conditions, groups in records:
@@ -79,7 +227,173 @@ def arrangements(records):
 
     return s
 
-main()
+def arrangements_dp(records):
+    """Same as arrangements, as a bottom-up DP over (position, group).
+
+    ways_j[i] is the number of ways groups[j:] can match conditions[i:].  Only two such
+    columns are kept, and group j can only start in a band of positions that leaves room
+    for the groups before and after it.  All buffers are shared by the records.
+    """
+    run_len = []    # run_len[i]: length of the run of non-'.' starting at i
+    no_hash = []    # no_hash[i]: 1 if there's no '#' at or after i
+    cur = []
+    nxt = []
+
+    s = 0
+    for conditions, groups in records:
+        # Add an undamaged spring at the end to simplify end-of-group checking.
+        conditions += "."
+        L = len(conditions)
+        G = len(groups)
+        if len(cur) < L + 2:
+            grow = [0] * (L + 2 - len(cur))
+            run_len += grow
+            no_hash += grow
+            cur += grow
+            nxt += grow
+
+        run_len[L] = 0
+        no_hash[L] = 1
+        for i in range(L - 1, -1, -1):
+            c = conditions[i]
+            run_len[i] = 0 if c == "." else run_len[i + 1] + 1
+            no_hash[i] = 0 if c == "#" else no_hash[i + 1]
+
+        # Room taken by all the groups, with a '.' between each pair
+        need = sum(groups) + G - 1
+        if need > L - 1:
+            continue
+
+        nxt[:L + 1] = no_hash[:L + 1]
+        after = -1
+        for j in range(G - 1, -1, -1):
+            k = groups[j]
+            # Group j has to leave room for groups[:j] before it and groups[j + 1:] after it.
+            after += k + 1
+            lo = need - after
+            hi = L - 1 - after
+            cur[hi + 1] = 0
+            for i in range(hi, lo - 1, -1):
+                v = cur[i + 1] if conditions[i] != "#" else 0
+                if run_len[i] >= k and conditions[i + k] != "#":
+                    v += nxt[i + k + 1]
+                cur[i] = v
+            cur, nxt = nxt, cur
+
+        m = nxt[0]
+        if DEBUG:
+            print(m, conditions, groups)
+        s += m
+
+    return s
+
+# Transfer-matrix counting for unfolded records.
+#
+# Scanning springs left to right, the state at a copy boundary is (r, p): the next group
+# is groups[r] (groups repeat, so only the index mod len(groups) matters) and p is the
+# number of '#'s already placed in it, or -1 if a group just ended and needs a '.'.
+# A copy's transfer maps (entry state, exit state) to a polynomial {shift: ways}, where
+# shift is the number of groups completed in the copy minus len(groups).  The unfolded
+# record matches when the shifts of all copies add up to 0.
+
+def _copy_transfer(segment, groups):
+    G = len(groups)
+    transfer = {}
+    for r0 in range(G):
+        for p0 in range(-1, groups[r0]):
+            states = {(r0, p0, 0): 1}
+            for ch in segment:
+                new = defaultdict(int)
+                for (r, p, done), ways in states.items():
+                    if ch != "#" and p <= 0:
+                        new[(r, 0, done)] += ways
+                    if ch != "." and p >= 0:
+                        if p + 1 == groups[r]:
+                            new[((r + 1) % G, -1, done + 1)] += ways
+                        else:
+                            new[(r, p + 1, done)] += ways
+                states = new
+
+            for (r, p, done), ways in states.items():
+                poly = transfer.setdefault(((r0, p0), (r, p)), defaultdict(int))
+                poly[done - G] += ways
+    return transfer
+
+def _compose(a, b, lo, hi):
+    """Transfer of a followed by b, dropping shifts outside [lo, hi]."""
+    b_from = defaultdict(list)
+    for (t, u), poly in b.items():
+        b_from[t].append((u, poly))
+
+    out = {}
+    for (s, t), pa in a.items():
+        for u, pb in b_from[t]:
+            poly = out.get((s, u))
+            for da, wa in pa.items():
+                for db, wb in pb.items():
+                    d = da + db
+                    if lo <= d <= hi:
+                        if poly is None:
+                            poly = out[(s, u)] = defaultdict(int)
+                        poly[d] += wa * wb
+    return out
+
+def arrangements_transfer(records, fold_factor):
+    """Same as arrangements on the records unfolded fold_factor times.
+
+    The first copy and the "?"-joined copies after it each get a transfer, and the
+    latter is raised to the power fold_factor - 1 by repeated squaring.  Shifts that the
+    remaining copies couldn't cancel out are dropped.  When a copy can only complete
+    exactly len(groups) groups, every polynomial has one term and the cost is
+    logarithmic in fold_factor.
+    """
+    F = fold_factor
+    if F <= 0:
+        # Nothing unfolded: each record is empty and has exactly one arrangement.
+        return len(records)
+
+    s = 0
+    for conditions, groups in records:
+        first = {k: v for k, v in _copy_transfer(conditions, groups).items()
+                 if k[0] == (0, 0)}
+        step = _copy_transfer("?" + conditions, groups)
+
+        shifts = [d for t in (first, step) for poly in t.values() for d in poly]
+        if not shifts:
+            continue
+        dmin = min(shifts)
+        dmax = max(shifts)
+
+        def _bounds(copies):
+            # Shifts that the other F - copies copies can still cancel out
+            return -(F - copies) * dmax, -(F - copies) * dmin
+
+        result = first
+        covered = 1
+        power = step
+        power_len = 1
+        k = F - 1
+        while k:
+            if k & 1:
+                covered += power_len
+                result = _compose(result, power, *_bounds(covered))
+            k >>= 1
+            if k:
+                power_len *= 2
+                power = _compose(power, power, *_bounds(power_len))
+
+        m = 0
+        for ((_, (r, p)), poly) in result.items():
+            if p <= 0:
+                m += poly.get(0, 0)
+        if DEBUG:
+            print(m, conditions, groups)
+        s += m
+
+    return s
+
+if __name__ == "__main__":
+    main()
 
 # multitime -n 5 ; median:
 # cpython: 0.597s
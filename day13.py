@@ -6,11 +6,22 @@ from pprint import pprint
 
 DEBUG = os.environ.get("DEBUG")
 
+# Part 2: "flip" tries every smudge and rescans; "xor" looks for mirror lines whose
+# signature pairs differ in exactly one bit.  "batch" packs every pattern's signatures
+# into shared arrays and answers both parts from one scan.
+ENGINE = os.environ.get("ENGINE", "flip")
+
 def dprint(*args):
     if DEBUG:
         print(*args)
 
 def main():
+    if ENGINE == "batch":
+        s1, s2 = batch_summaries(read_batch(fileinput.input()))
+        print("Part 1:", s1)
+        print("Part 2:", s2)
+        return
+
     grids = [[]]
     for line in fileinput.input():
         line = line.strip()
@@ -28,9 +39,10 @@ def main():
 
     print("Part 1:", s)
 
+    fixed = reflection_summary_smudged if ENGINE == "xor" else reflection_summary_fixed
     s = 0
     for grid in grids:
-        s += reflection_summary_fixed(grid)
+        s += fixed(grid)
 
     print("Part 2:", s)
 
@@ -52,10 +64,104 @@ def reflection_summary_fixed(grid):
 
     return None
 
+def reflection_summary_smudged(grid):
+    """Same as reflection_summary_fixed, without copying or flipping anything.
+
+    A line is the fixed reflection if exactly one pair of signatures it mirrors differs,
+    and by exactly one bit (the smudge).
+    """
+    row_sigs, col_sigs = signatures(grid)
+    for k in smudged_reflections(col_sigs):
+        return k
+    for k in smudged_reflections(row_sigs):
+        return 100 * k
+    return None
+
+def smudged_reflections(sigs):
+    for k1 in range(1, len(sigs)):
+        smudges = 0
+        for d in range(min(k1, len(sigs) - k1)):
+            x = sigs[k1 - 1 - d] ^ sigs[k1 + d]
+            if x:
+                if x & (x - 1):
+                    break
+                smudges += 1
+                if smudges > 1:
+                    break
+        else:
+            if smudges == 1:
+                yield k1
+
+def read_batch(lines):
+    """Packs the signatures of all patterns into (row_sigs, row_offsets, col_sigs, col_offsets).
+
+    Pattern p's row signatures are row_sigs[row_offsets[p]:row_offsets[p + 1]], and likewise
+    for its columns.
+    """
+    row_sigs = []
+    row_offsets = [0]
+    col_sigs = []
+    col_offsets = [0]
+
+    def _end_pattern():
+        if len(row_sigs) > row_offsets[-1]:
+            row_offsets.append(len(row_sigs))
+            col_offsets.append(len(col_sigs))
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            _end_pattern()
+            continue
+
+        i = len(row_sigs) - row_offsets[-1]
+        if i == 0:
+            col_sigs.extend([0] * len(line))
+        c0 = col_offsets[-1]
+        sig = 0
+        for j, c in enumerate(line):
+            if c == '#':
+                sig += 1 << j
+                col_sigs[c0 + j] += 1 << i
+        row_sigs.append(sig)
+    _end_pattern()
+
+    return row_sigs, row_offsets, col_sigs, col_offsets
+
+def batch_summaries(batch):
+    """Returns the (part 1, part 2) sums, classifying every mirror line in one pass."""
+    row_sigs, row_offsets, col_sigs, col_offsets = batch
+    s1 = 0
+    s2 = 0
+    for p in range(len(row_offsets) - 1):
+        clean = None
+        smudged = None
+        for sigs, offsets, weight in ((col_sigs, col_offsets, 1), (row_sigs, row_offsets, 100)):
+            lo = offsets[p]
+            size = offsets[p + 1] - lo
+            for k1 in range(1, size):
+                # 0: a reflection; 1: a reflection with one smudge; 2: neither
+                defects = 0
+                for d in range(min(k1, size - k1)):
+                    x = sigs[lo + k1 - 1 - d] ^ sigs[lo + k1 + d]
+                    if x:
+                        defects += 1 if x & (x - 1) == 0 else 2
+                        if defects > 1:
+                            break
+                if defects == 0 and clean is None:
+                    clean = weight * k1
+                elif defects == 1 and smudged is None:
+                    smudged = weight * k1
+
+        dprint(p, clean, smudged)
+        s1 += clean
+        s2 += smudged
+    return s1, s2
+
 def reflection_summary(grid):
     return next(reflection_summaries(grid))
 
-def reflection_summaries(grid):
+def signatures(grid):
     m = len(grid)
     n = len(grid[0])
 
@@ -75,6 +181,11 @@ def reflection_summaries(grid):
                 sig += 1 << i
         col_sigs.append(sig)
 
+    return row_sigs, col_sigs
+
+def reflection_summaries(grid):
+    row_sigs, col_sigs = signatures(grid)
+
     def _before_reflection(sigs):
         for k1 in range(1, len(sigs)):
             k2 = len(sigs) - k1
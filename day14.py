@@ -1,53 +1,137 @@
 #!/usr/bin/env python3
 
-import fileinput
 import os
+import sys
 from pprint import pprint
 
+from collections import namedtuple
+
 DEBUG = os.environ.get("DEBUG")
 
+# "grid" rolls rocks cell by cell on the character grid; "bits" tilts row/column bitmasks;
+# "segments" keeps only rock counts per free segment between cube rocks.
+ENGINE = os.environ.get("ENGINE", "grid")
+
 def dprint(*args):
     if DEBUG:
         print(*args)
 
 def main():
-    grid = [list(line.rstrip()) for line in fileinput.input()]
+    inp = open(sys.argv[1])
+    all_cycles = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000000
 
-    roll_north(grid)
+    grid = [list(line.rstrip()) for line in inp]
+    m = len(grid)
+    n = len(grid[0])
 
-    print("Part 1:", total_load(grid))
+    if ENGINE == "bits":
+        rows = line_masks(grid, 'O')
+        row_segs = free_segments(line_masks(grid, '#'), n)
+        col_segs = free_segments(transpose_bits(line_masks(grid, '#'), n), m)
 
-    roll_north(grid)
-    roll_west(grid)
-    roll_south(grid)
-    roll_east(grid)
+        north = transpose_bits(tilt_bits(transpose_bits(rows, n), col_segs, True), m)
+        print("Part 1:", total_load_bits(north))
 
-    sig_to_time = {signature(grid): 1}
-    time_to_load = {1: total_load(grid)}
+        state = tuple(rows)
+
+        def _spin(rows):
+            return tuple(spin_cycle_bits(rows, row_segs, col_segs))
+
+        def _key(rows):
+            return rows
+
+        _load = total_load_bits
+    elif ENGINE == "segments":
+        north = segment_index(grid, -1, 0)
+        west = segment_index(grid, 0, -1)
+        south = segment_index(grid, 1, 0)
+        east = segment_index(grid, 0, 1)
+
+        rocks = [i * n + j for i in range(m) for j in range(n) if grid[i][j] == 'O']
+        north_counts = [0] * (len(north.offsets) - 1)
+        for k in rocks:
+            north_counts[north.seg_of[k]] += 1
+        print("Part 1:", segment_load(north_counts, north))
+
+        # The state is the east-segment counts, so the search starts after one cycle.
+        counts = tilt_segments(north_counts, north, west)
+        counts = tilt_segments(counts, west, south)
+        state = tuple(tilt_segments(counts, south, east))
+
+        def _spin(counts):
+            return tuple(spin_cycle_segments(counts, north, west, south, east))
+
+        def _key(counts):
+            return counts
+
+        def _load(counts):
+            return segment_load(counts, east)
+    else:
+        state = [row[:] for row in grid]
 
-    t = 1
-    period = None
-    while True:
         roll_north(grid)
-        roll_west(grid)
-        roll_south(grid)
-        roll_east(grid)
-        t += 1
 
-        s = signature(grid)
-        time_to_load[t] = total_load(grid)
+        print("Part 1:", total_load(grid))
+
+        def _spin(grid):
+            grid = [row[:] for row in grid]
+            roll_north(grid)
+            roll_west(grid)
+            roll_south(grid)
+            roll_east(grid)
+            return grid
+
+        def _key(grid):
+            return tuple(''.join(row) for row in grid)
+
+        _load = total_load
 
-        if s in sig_to_time:
-            period = t - sig_to_time[s]
-            break
-        else:
-            sig_to_time[s] = t
+    start, period, loads = find_cycle(state, _spin, _load, _key)
+    if ENGINE == "segments":
+        start += 1
+        loads = [total_load(grid)] + loads
+    dprint(f"{start=} {period=}")
+
+    if all_cycles < len(loads):
+        print("Part 2:", loads[all_cycles])
+    else:
+        print("Part 2:", loads[start + (all_cycles - start) % period])
+
+def find_cycle(x0, step, load, key):
+    """Finds a cycle in the states x0, step(x0), step(step(x0)), ...
+
+    Only a fixed-width hash of key(state) is remembered for each time.  When a hash
+    repeats after p steps, the current state is kept and compared with the following
+    states.  If it hasn't come back within p steps (a hash collision), the search goes
+    on Brent-style from the latest state with a doubled window, so the period found is
+    always verified on real states.
+
+    Returns (start, period, loads): state start + period equals state start, and loads[t]
+    is the load of state t for every t <= start + period.
+    """
+    loads = [load(x0)]
+    seen = {hash(key(x0)): 0}
+    candidate = None
+    state = x0
+    t = 0
+    while True:
+        state = step(state)
+        t += 1
+        loads.append(load(state))
 
-    all_cycles = 1000000000
-    k = (all_cycles - t) // period
-    dt = all_cycles - (t + k * period)
-    t += dt - period
-    print("Part 2:", time_to_load[t])
+        if candidate is not None:
+            start, start_state, window = candidate
+            if state == start_state:
+                return start, t - start, loads
+            if t - start >= window:
+                dprint(f"no repeat of {start=} within {window=}")
+                candidate = (t, state, 2 * window)
+            continue
+
+        h = hash(key(state))
+        if h in seen:
+            candidate = (t, state, t - seen[h])
+        seen[h] = t
 
 def roll_north(grid):
     m = len(grid)
@@ -114,27 +198,134 @@ def roll_east(grid):
                 grid[i][rock] = 'O'
                 grid[i][rock - 1] = '.'
 
-def signature(grid):
+def total_load(grid):
     m = len(grid)
     n = len(grid[0])
-    sig = 0
+    load = 0
     for i in range(m):
         for j in range(n):
-            sig <<= 1
             if grid[i][j] == 'O':
-                sig += 1
-    return sig
+                load += m - i
 
-def total_load(grid):
+    return load
+
+# Bit-board representation: one int per row (or column) with bit j (or i) set for each
+# rock.  A tilt moves the rocks of each free segment between cube rocks to its end.
+
+def line_masks(grid, ch):
+    return [sum(1 << j for j, c in enumerate(row) if c == ch) for row in grid]
+
+def transpose_bits(lines, width):
+    out = [0] * width
+    for k, line in enumerate(lines):
+        bit = 1 << k
+        while line:
+            low = line & -line
+            out[low.bit_length() - 1] |= bit
+            line ^= low
+    return out
+
+def free_segments(cube_lines, length):
+    """For each line, the (lo, hi, mask) of every run of cells between cube rocks."""
+    segs = []
+    for cubes in cube_lines:
+        line_segs = []
+        lo = 0
+        for k in range(length + 1):
+            if k == length or cubes >> k & 1:
+                if k > lo:
+                    line_segs.append((lo, k, ((1 << (k - lo)) - 1) << lo))
+                lo = k + 1
+        segs.append(line_segs)
+    return segs
+
+def tilt_bits(lines, segs, toward_low):
+    out = []
+    for line, line_segs in zip(lines, segs):
+        tilted = 0
+        if line:
+            for lo, hi, mask in line_segs:
+                c = bin(line & mask).count("1")
+                if c:
+                    tilted |= ((1 << c) - 1) << (lo if toward_low else hi - c)
+        out.append(tilted)
+    return out
+
+def spin_cycle_bits(rows, row_segs, col_segs):
+    m = len(row_segs)
+    n = len(col_segs)
+    cols = tilt_bits(transpose_bits(rows, n), col_segs, True)   # north
+    rows = tilt_bits(transpose_bits(cols, m), row_segs, True)   # west
+    cols = tilt_bits(transpose_bits(rows, n), col_segs, False)  # south
+    return tilt_bits(transpose_bits(cols, m), row_segs, False)  # east
+
+def total_load_bits(rows):
+    m = len(rows)
+    return sum((m - i) * bin(row).count("1") for i, row in enumerate(rows))
+
+# Segment index for one tilt direction: the free runs between cube rocks, each listed
+# starting from the cell the rocks roll toward.  seg_of[k] is the run holding cell
+# i * n + j (-1 for cube rocks), run s covers cells[offsets[s]:offsets[s + 1]], and
+# loads[x] is the total load of the run's cells from its head through cells[x].
+
+SegmentIndex = namedtuple('SegmentIndex', 'seg_of cells offsets loads')
+
+def segment_index(grid, di, dj):
     m = len(grid)
     n = len(grid[0])
-    load = 0
+    seg_of = [-1] * (m * n)
+    cells = []
+    offsets = [0]
+    loads = []
     for i in range(m):
         for j in range(n):
-            if grid[i][j] == 'O':
-                load += m - i
+            if grid[i][j] == '#':
+                continue
+            ii = i + di
+            jj = j + dj
+            if (0 <= ii < m) and (0 <= jj < n) and grid[ii][jj] != '#':
+                continue
 
-    return load
+            # (i, j) is a head; walk back against the tilt.
+            s = len(offsets) - 1
+            load = 0
+            ii = i
+            jj = j
+            while (0 <= ii < m) and (0 <= jj < n) and grid[ii][jj] != '#':
+                k = ii * n + jj
+                seg_of[k] = s
+                cells.append(k)
+                load += m - ii
+                loads.append(load)
+                ii -= di
+                jj -= dj
+            offsets.append(len(cells))
+
+    return SegmentIndex(seg_of, cells, offsets, loads)
+
+def tilt_segments(counts, src, dst):
+    """Counts per dst segment of the rocks packed at the heads of the src segments."""
+    out = [0] * (len(dst.offsets) - 1)
+    seg_of = dst.seg_of
+    cells = src.cells
+    offsets = src.offsets
+    for s, c in enumerate(counts):
+        if c:
+            o = offsets[s]
+            for k in cells[o:o + c]:
+                out[seg_of[k]] += 1
+    return out
+
+def spin_cycle_segments(counts, north, west, south, east):
+    counts = tilt_segments(counts, east, north)
+    counts = tilt_segments(counts, north, west)
+    counts = tilt_segments(counts, west, south)
+    return tilt_segments(counts, south, east)
+
+def segment_load(counts, index):
+    loads = index.loads
+    offsets = index.offsets
+    return sum(loads[offsets[s] + c - 1] for s, c in enumerate(counts) if c)
 
 def show(grid):
     for row in grid:
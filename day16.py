@@ -1,11 +1,20 @@
 #!/usr/bin/env python3
 
 import fileinput
+import multiprocessing
 import os
 from pprint import pprint
 
+from collections import Counter
+
 DEBUG = os.environ.get("DEBUG")
 
+# Number of processes for the part 2 edge sweep; 1 runs it serially.
+WORKERS = int(os.environ.get("WORKERS", "1"))
+
+# "bfs" traces every beam tile by tile; "scc" precompiles the mirror/splitter graph.
+ENGINE = os.environ.get("ENGINE", "bfs")
+
 def dprint(*args):
     if DEBUG:
         print(*args)
@@ -23,70 +32,253 @@ dir_del = {
     WEST: (0, -1),
 }
 
+# Keyed by (incoming direction, tile byte)
 out_dirs = {
-    (NORTH, '/'): (EAST, NONE),
-    (NORTH, '\\'): (WEST, NONE),
-    (NORTH, '-'): (WEST, EAST),
-    (SOUTH, '/'): (WEST, NONE),
-    (SOUTH, '\\'): (EAST, NONE),
-    (SOUTH, '-'): (WEST, EAST),
-    (WEST, '/'): (SOUTH, NONE),
-    (WEST, '\\'): (NORTH, NONE),
-    (WEST, '|'): (NORTH, SOUTH),
-    (EAST, '/'): (NORTH, NONE),
-    (EAST, '\\'): (SOUTH, NONE),
-    (EAST, '|'): (NORTH, SOUTH),
+    (NORTH, ord('/')): (EAST, NONE),
+    (NORTH, ord('\\')): (WEST, NONE),
+    (NORTH, ord('-')): (WEST, EAST),
+    (SOUTH, ord('/')): (WEST, NONE),
+    (SOUTH, ord('\\')): (EAST, NONE),
+    (SOUTH, ord('-')): (WEST, EAST),
+    (WEST, ord('/')): (SOUTH, NONE),
+    (WEST, ord('\\')): (NORTH, NONE),
+    (WEST, ord('|')): (NORTH, SOUTH),
+    (EAST, ord('/')): (NORTH, NONE),
+    (EAST, ord('\\')): (SOUTH, NONE),
+    (EAST, ord('|')): (NORTH, SOUTH),
 }
 
-def main():
-    grid = [list(line.rstrip()) for line in fileinput.input()]
-    m = len(grid)
-    n = len(grid[0])
-
-    def _energized_tiles(i_start, j_start, dir_start):
-        beam = {}
-        q = [(i_start, j_start, dir_start)]
-        while q:
-            i, j, dir = q[0]
-            q = q[1:]
-
-            if (b := beam.get((i, j), NONE)) & dir:
-                continue
+def energized_tiles(grid, n, i_start, j_start, dir_start, stats=None):
+    """grid is the contraption as bytes, row-major with rows of length n.
 
-            beam[(i, j)] = b | dir
+    If stats is a Counter, it is updated with the tiles energized, worklist pushes,
+    and pops of beams that had already passed that way ("duplicates").
+    """
+    m = len(grid) // n
+    # Bitmask of beam directions seen on each tile
+    beam = bytearray(len(grid))
+    stack = [(i_start * n + j_start) << 4 | dir_start]
+    pushes = 1
+    duplicates = 0
+    energized = 0
+    while stack:
+        item = stack.pop()
+        k = item >> 4
+        dir = item & 15
 
-            ddir1, ddir2 = out_dirs.get((dir, grid[i][j]), (dir, NONE))
+        b = beam[k]
+        if b & dir:
+            duplicates += 1
+            continue
+        if not b:
+            energized += 1
+        beam[k] = b | dir
 
-            assert ddir1 != NONE
-            di, dj = dir_del[ddir1]
+        i, j = divmod(k, n)
+        for ddir in out_dirs.get((dir, grid[k]), (dir, NONE)):
+            if ddir == NONE:
+                continue
+            di, dj = dir_del[ddir]
             ii = i + di
             jj = j + dj
             if (0 <= ii < m) and (0 <= jj < n):
-                q.append((ii, jj, ddir1))
-
-            if ddir2 != NONE:
-                di, dj = dir_del[ddir2]
-                ii = i + di
-                jj = j + dj
-                if (0 <= ii < m) and (0 <= jj < n):
-                    q.append((ii, jj, ddir2))
-        return len(beam)
-
-    print("Part 1:", _energized_tiles(0, 0, EAST))
-
-    def _starts():
-        for j in range(n):
-            yield (0, j, SOUTH)
-            yield (m - 1, j, NORTH)
-
-        for i in range(m):
-            yield(i, 0, EAST)
-            yield(i, n - 1, WEST)
-
-    m = max(_energized_tiles(*start) for start in _starts())
-    print("Part 2:", m)
-        
-main()
+                stack.append((ii * n + jj) << 4 | ddir)
+                pushes += 1
+
+    if stats is not None:
+        stats.update(tiles=energized, pushes=pushes, duplicates=duplicates)
+    return energized
+
+class BeamGraph:
+    """Condensed beam graph for answering many energized-tile queries.
+
+    A node is a beam leaving a mirror or splitter tile in some direction, with id
+    tile * 4 + direction index.  Its edge runs straight to the next mirror or splitter
+    (or off the grid) and carries the bitset of tiles lit on the way.  Strongly
+    connected components are found with Tarjan's algorithm and each one gets the union
+    of the bitsets reachable from it, so a query is a short trace plus a few ORs.
+    """
+
+    def __init__(self, grid, n):
+        self.grid = grid
+        self.n = n
+        self.m = len(grid) // n
+        optics = b"/\\|-"
+        self.is_optic = [c in optics for c in grid]
+
+        nnodes = len(grid) * 4
+        self.succ = [()] * nnodes
+        self.lit = [0] * nnodes
+        for k in range(len(grid)):
+            if self.is_optic[k]:
+                for dir in dir_del:
+                    v = k * 4 + _dir_index(dir)
+                    self.lit[v], self.succ[v] = self._trace(k, dir, False)
+
+        self.comp, self.reach = self._condense()
+
+    def _trace(self, k, dir, inclusive):
+        """Follows a beam from tile k until it reaches an optic or leaves the grid.
+
+        Returns (bitset of lit tiles, successor node ids).
+        """
+        n = self.n
+        m = self.m
+        i, j = divmod(k, n)
+        di, dj = dir_del[dir]
+        bits = 0
+        if not inclusive:
+            i += di
+            j += dj
+        while (0 <= i < m) and (0 <= j < n):
+            k = i * n + j
+            bits |= 1 << k
+            if self.is_optic[k]:
+                ddir1, ddir2 = out_dirs.get((dir, self.grid[k]), (dir, NONE))
+                succ = [k * 4 + _dir_index(ddir1)]
+                if ddir2 != NONE:
+                    succ.append(k * 4 + _dir_index(ddir2))
+                return bits, tuple(succ)
+            i += di
+            j += dj
+        return bits, ()
+
+    def _condense(self):
+        """Iterative Tarjan; returns (node -> component, component -> reachable bitset)."""
+        succ = self.succ
+        lit = self.lit
+        nnodes = len(succ)
+        index = [-1] * nnodes
+        low = [0] * nnodes
+        on_stack = [False] * nnodes
+        comp = [-1] * nnodes
+        reach = []
+        stack = []
+        counter = 0
+
+        for root in range(nnodes):
+            if index[root] >= 0 or not self.is_optic[root >> 2]:
+                continue
+            work = [(root, 0)]
+            while work:
+                v, pi = work[-1]
+                if pi == 0:
+                    index[v] = low[v] = counter
+                    counter += 1
+                    stack.append(v)
+                    on_stack[v] = True
+
+                descended = False
+                while pi < len(succ[v]):
+                    w = succ[v][pi]
+                    pi += 1
+                    if index[w] < 0:
+                        work[-1] = (v, pi)
+                        work.append((w, 0))
+                        descended = True
+                        break
+                    elif on_stack[w]:
+                        low[v] = min(low[v], index[w])
+                if descended:
+                    continue
+
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    low[u] = min(low[u], low[v])
+
+                if low[v] == index[v]:
+                    # Successor components are all finished, so their reach is known.
+                    c = len(reach)
+                    members = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        comp[w] = c
+                        members.append(w)
+                        if w == v:
+                            break
+                    bits = 0
+                    for w in members:
+                        bits |= lit[w]
+                        for x in succ[w]:
+                            if comp[x] != c:
+                                bits |= reach[comp[x]]
+                    reach.append(bits)
+
+        return comp, reach
+
+    def energized_tiles(self, i_start, j_start, dir_start):
+        bits, succ = self._trace(i_start * self.n + j_start, dir_start, True)
+        for v in succ:
+            bits |= self.reach[self.comp[v]]
+        return bin(bits).count("1")
+
+def _dir_index(dir):
+    return dir.bit_length() - 1
+
+# Worker process state: the grid is handed over once per worker, not once per start.
+_worker_grid = None
+_worker_n = None
+
+def _worker_init(grid, n):
+    global _worker_grid, _worker_n
+    _worker_grid = grid
+    _worker_n = n
+
+def _worker_energized_tiles(start):
+    stats = Counter()
+    return start, energized_tiles(_worker_grid, _worker_n, *start, stats), stats
+
+def edge_starts(m, n):
+    for j in range(n):
+        yield (0, j, SOUTH)
+        yield (m - 1, j, NORTH)
+
+    for i in range(m):
+        yield(i, 0, EAST)
+        yield(i, n - 1, WEST)
+
+def energized_by_start(grid, n, starts, workers=1, stats=None):
+    """Returns {start: energized tile count}, spreading the starts over a process pool.
+
+    stats, if given, is a Counter that accumulates energized_tiles' counters.
+    """
+    starts = list(starts)
+    if ENGINE == "scc":
+        graph = BeamGraph(grid, n)
+        return {start: graph.energized_tiles(*start) for start in starts}
+    if workers <= 1:
+        return {start: energized_tiles(grid, n, *start, stats) for start in starts}
+
+    counts = {}
+    chunksize = max(1, len(starts) // (workers * 4))
+    with multiprocessing.Pool(workers, initializer=_worker_init, initargs=(grid, n)) as pool:
+        for start, count, start_stats in pool.imap_unordered(_worker_energized_tiles, starts,
+                                                             chunksize):
+            counts[start] = count
+            if stats is not None:
+                stats.update(start_stats)
+    return counts
+
+def main():
+    lines = [line.rstrip() for line in fileinput.input()]
+    m = len(lines)
+    n = len(lines[0])
+    grid = "".join(lines).encode()
+
+    print("Part 1:", energized_tiles(grid, n, 0, 0, EAST))
+
+    stats = Counter()
+    counts = energized_by_start(grid, n, edge_starts(m, n), WORKERS, stats)
+    if DEBUG:
+        for start, count in sorted(counts.items()):
+            print(start, count)
+        print(dict(stats))
+    print("Part 2:", max(counts.values()))
+
+if __name__ == "__main__":
+    main()
 
 # multitime -n 5 ; median:
 # cpython: 3.783s
@@ -4,12 +4,17 @@ import fileinput
 import os
 from pprint import pprint
 
+import functools
 import heapq
 import math
 from collections import namedtuple, defaultdict
 
 DEBUG = int(os.environ.get("DEBUG", "0"))
 
+# "astar": heapq A* over State namedtuples with the reverse-Dijkstra heuristic.
+# "bucket": Dial's algorithm over integer state ids with flat arrays.
+ENGINE = os.environ.get("ENGINE", "astar")
+
 def dprint(*args):
     if DEBUG:
         print(*args)
@@ -22,105 +27,154 @@ def rot_left(vel):
 def rot_right(vel):
     return (vel[1], -vel[0])
 
-def main():
-    grid = [list(map(int, line.rstrip())) for line in fileinput.input()]
-    m = len(grid)
-    n = len(grid[0])
+def run_prefix_sums(grid):
+    """Returns (row_prefix, col_prefix) with row_prefix[i][j] = sum(grid[i][:j])
+    and col_prefix[j][i] = sum of grid[:i][j], so any straight run's loss is one subtraction."""
+    row_prefix = []
+    for row in grid:
+        p = [0]
+        for x in row:
+            p.append(p[-1] + x)
+        row_prefix.append(p)
+    col_prefix = []
+    for j in range(len(grid[0])):
+        p = [0]
+        for row in grid:
+            p.append(p[-1] + row[j])
+        col_prefix.append(p)
+    return row_prefix, col_prefix
+
+class HeatLossRouter:
+    """Answers many (start, goal, min_run, max_run) queries over one grid.
+
+    The flat grid and run prefix sums are built once.  The A* heuristic for a goal
+    (a reverse Dijkstra over the cells) is cached per goal, keeping the most recently
+    used heuristic_cache_size tables.
 
-    def _adj(i, j):
+        router = HeatLossRouter(grid)
+        router.min_heat_loss((0, 0), (m - 1, n - 1), 4, 10)
+    """
+
+    def __init__(self, grid, heuristic_cache_size=8):
+        self.grid = grid
+        self.m = len(grid)
+        self.n = len(grid[0])
+        self.flat = [x for row in grid for x in row]
+        self.row_prefix, self.col_prefix = run_prefix_sums(grid)
+        self.min_loss_to = functools.lru_cache(maxsize=heuristic_cache_size)(self._min_loss_to)
+
+    def _adj(self, i, j):
         if i > 0:
             yield (i - 1, j)
-        if i < m - 1:
+        if i < self.m - 1:
             yield (i + 1, j)
         if j > 0:
             yield (i, j - 1)
-        if j < n - 1:
+        if j < self.n - 1:
             yield (i, j + 1)
 
-    min_loss_to_factory = {}
-    q = [(0, m - 1, n - 1)]
-    while q:
-        loss, i, j = heapq.heappop(q)
-        if (i, j) in min_loss_to_factory:
-            continue
-        min_loss_to_factory[(i, j)] = loss
-        if DEBUG & 2:
-            for iii in range(m):
-                print(''.join("{:3}".format(str(min_loss_to_factory.get((iii, jjj), '-')))
-                              for jjj in range(n)))
-            print()
-
-        for ii, jj in _adj(i, j):
-            lloss = grid[i][j] + loss
-            heapq.heappush(q, (lloss, ii, jj))
-
-    if DEBUG > 100:
-        for i in range(m):
-            for j in range(n):
-                if i == m - 1 and j == n - 1:
-                    continue
-                mm = min(grid[ii][jj] + min_loss_to_factory[(ii, jj)]
-                        for ii, jj in _adj(i, j))
-                try:
-                    assert min_loss_to_factory[(i, j)] == mm
-                except AssertionError:
-                    print(i, j)
-                    raise
-
-    def min_heat_loss(min_run, max_run):
+    def _min_loss_to(self, goal):
+        """Minimum loss from each cell to goal, ignoring the run constraints."""
+        grid = self.grid
+        m = self.m
+        n = self.n
+
+        min_loss = {}
+        q = [(0,) + goal]
+        while q:
+            loss, i, j = heapq.heappop(q)
+            if (i, j) in min_loss:
+                continue
+            min_loss[(i, j)] = loss
+            if DEBUG & 2:
+                for iii in range(m):
+                    print(''.join("{:3}".format(str(min_loss.get((iii, jjj), '-')))
+                                  for jjj in range(n)))
+                print()
+
+            for ii, jj in self._adj(i, j):
+                lloss = grid[i][j] + loss
+                heapq.heappush(q, (lloss, ii, jj))
+
+        if DEBUG > 100:
+            for i in range(m):
+                for j in range(n):
+                    if (i, j) == goal:
+                        continue
+                    mm = min(grid[ii][jj] + min_loss[(ii, jj)]
+                            for ii, jj in self._adj(i, j))
+                    try:
+                        assert min_loss[(i, j)] == mm
+                    except AssertionError:
+                        print(i, j)
+                        raise
+
+        return min_loss
+
+    def min_heat_loss(self, start=(0, 0), goal=None, min_run=1, max_run=3, engine=None):
+        if goal is None:
+            goal = (self.m - 1, self.n - 1)
+        if (engine or ENGINE) == "bucket":
+            return self._min_heat_loss_bucket(start, goal, min_run, max_run)
+        else:
+            return self._min_heat_loss_astar(start, goal, min_run, max_run)
+
+    def _min_heat_loss_astar(self, start_loc, goal, min_run, max_run):
+        m = self.m
+        n = self.n
+        row_prefix = self.row_prefix
+        col_prefix = self.col_prefix
+        min_loss_to_goal = self.min_loss_to(goal)
+
         def _moves(s):
-            if s.loc == (0, 0):
-                for k in range(min_run, max_run + 1):
-                    if k < m:
-                        yield State(loc=(k, 0), vel=(1, 0))
-                    if k < n:
-                        yield State(loc=(0, k), vel=(0, 1))
-                return
+            """Yields (next state, loss of the run to it), stopping at the grid edge."""
+            if s.vel == (0, 0):
+                vels = ((1, 0), (-1, 0), (0, 1), (0, -1))
+            else:
+                vels = (rot_left(s.vel), rot_right(s.vel))
 
-            for vv in (rot_left(s.vel), rot_right(s.vel)):
+            i, j = s.loc
+            for vv in vels:
                 di, dj = vv
                 for k in range(min_run, max_run + 1):
-                    ii = s.loc[0] + k * di
-                    jj = s.loc[1] + k * dj
-                    if (0 <= ii < m) and (0 <= jj < n):
-                        yield State(loc=(ii, jj), vel=vv)
+                    ii = i + k * di
+                    jj = j + k * dj
+                    if not ((0 <= ii < m) and (0 <= jj < n)):
+                        break
+                    # The run's loss covers the cells after s.loc, up to and including (ii, jj).
+                    if di == 0:
+                        p = row_prefix[i]
+                        run_loss = p[jj + 1] - p[j + 1] if dj > 0 else p[j] - p[jj]
+                    else:
+                        p = col_prefix[j]
+                        run_loss = p[ii + 1] - p[i + 1] if di > 0 else p[i] - p[ii]
+                    yield State(loc=(ii, jj), vel=vv), run_loss
 
         pred = {}
-        start = State(loc=(0, 0), vel=(0, 0))
+        start = State(loc=start_loc, vel=(0, 0))
         loss_so_far = defaultdict(lambda: math.inf)
         loss_so_far[start] = 0
-        q = [(min_loss_to_factory[start.loc], start)]
-        frontier = set([start])
+        q = [(min_loss_to_goal[start.loc], start)]
         while q:
             e, s = heapq.heappop(q)
-            if s.loc == (m - 1, n - 1):
+            if s.loc == goal:
                 break
-
-            frontier.remove(s)
+            if e > loss_so_far[s] + min_loss_to_goal[s.loc]:
+                # Superseded by a later, cheaper push of the same state
+                continue
 
             dprint("==", e, s)
 
-            i, j = s.loc
-            for ss in _moves(s):
-                ii, jj = ss.loc
-
-                loss = loss_so_far[s]
-                if ii == i:
-                    for mj in range(jj, j, -ss.vel[1]):
-                        loss += grid[ii][mj]
-                else:
-                    assert jj == j
-                    for mi in range(ii, i, -ss.vel[0]):
-                        loss += grid[mi][jj]
-
+            for ss, run_loss in _moves(s):
+                loss = loss_so_far[s] + run_loss
                 if loss < loss_so_far[ss]:
                     pred[ss] = s
                     loss_so_far[ss] = loss
-                    est_loss = loss + min_loss_to_factory[ss.loc]
-                    if ss not in frontier:
-                        frontier.add(ss)
-                        heapq.heappush(q, (est_loss, ss))
-                        dprint("  > ", est_loss, ss)
+                    est_loss = loss + min_loss_to_goal[ss.loc]
+                    heapq.heappush(q, (est_loss, ss))
+                    dprint("  > ", est_loss, ss)
+        else:
+            return math.inf
 
         ret = loss_so_far[s]
 
@@ -145,11 +199,74 @@ def main():
 
         return ret
 
-    print("Part 1:", min_heat_loss(1, 3))
-    print("Part 2:", min_heat_loss(4, 10))
-        
-main()
+    def _min_heat_loss_bucket(self, start, goal, min_run, max_run):
+        """Dijkstra with a circular bucket queue (Dial's algorithm).
+
+        A state is the cell where a run ends plus the axis of that run, encoded as
+        (i * n + j) * 2 + axis, where axis 0 is vertical and 1 is horizontal.
+        Edge weights are at most 9 * max_run, so that many + 1 buckets suffice.
+        """
+        m = self.m
+        n = self.n
+        flat = self.flat
+        goal = goal[0] * n + goal[1]
+        start = start[0] * n + start[1]
+
+        best = [math.inf] * (m * n * 2)
+        nbuckets = 9 * max_run + 1
+        buckets = [[] for _ in range(nbuckets)]
+        # The start cell can be left along either axis.
+        best[start * 2] = best[start * 2 + 1] = 0
+        buckets[0] = [start * 2, start * 2 + 1]
+        pending = 2
+        loss = 0
+        while pending:
+            bucket = buckets[loss % nbuckets]
+            while bucket:
+                sid = bucket.pop()
+                pending -= 1
+                if best[sid] != loss:
+                    continue
+                k = sid >> 1
+                if k == goal:
+                    return loss
+                i, j = divmod(k, n)
+                if sid & 1:
+                    # Arrived horizontally; turn to move vertically.
+                    steps = ((n, m - 1 - i), (-n, i))
+                    axis = 0
+                else:
+                    steps = ((1, n - 1 - j), (-1, j))
+                    axis = 1
+                for delta, room in steps:
+                    kk = k
+                    run_loss = loss
+                    for r in range(1, min(max_run, room) + 1):
+                        kk += delta
+                        run_loss += flat[kk]
+                        if r < min_run:
+                            continue
+                        ss = kk * 2 + axis
+                        if run_loss < best[ss]:
+                            best[ss] = run_loss
+                            buckets[run_loss % nbuckets].append(ss)
+                            pending += 1
+            loss += 1
+        return math.inf
+
+def main():
+    grid = [list(map(int, line.rstrip())) for line in fileinput.input()]
+    router = HeatLossRouter(grid)
+
+    print("Part 1:", router.min_heat_loss(min_run=1, max_run=3))
+    print("Part 2:", router.min_heat_loss(min_run=4, max_run=10))
+    dprint(router.min_loss_to.cache_info())
+
+if __name__ == "__main__":
+    main()
 
 # multitime -n 5 ; median:
 # cpython: 3.842s
 # pypy:    2.278s
+# ENGINE=bucket (same machine, random 141x141 grid; astar took 3.0s there):
+# cpython: 0.558s
@@ -5,19 +5,166 @@ import sys
 from pprint import pprint
 
 import heapq
+import numpy as np
 import numpy.linalg
-from collections import defaultdict
+from collections import defaultdict, deque
 
 DEBUG = int(os.environ.get("DEBUG", "0"))
 
+# Part 1 reachability engine: "numpy" steps a boolean frontier mask with shifted ORs;
+# "deque" is a plain BFS over flat arrays.
+ENGINE = os.environ.get("ENGINE", "numpy")
+
+# Part 2 model: "quadratic" fits a quadratic to a BFS over the infinite grid;
+# "tiles" does one BFS per tile entry point and counts the other tiles analytically.
+PART2 = os.environ.get("PART2", "quadratic")
+
 def dprint(*args):
     if DEBUG:
         print(*args)
 
+def step_counts_numpy(grid, start, max_steps):
+    """Returns counts[d] = number of plots at distance exactly d from start (d <= max_steps)."""
+    garden = np.array([[c in ".S" for c in row] for row in grid], dtype=bool)
+    frontier = np.zeros_like(garden)
+    frontier[start] = True
+    reached = frontier.copy()
+    counts = [1]
+    for _ in range(max_steps):
+        nxt = np.zeros_like(garden)
+        nxt[1:, :] |= frontier[:-1, :]
+        nxt[:-1, :] |= frontier[1:, :]
+        nxt[:, 1:] |= frontier[:, :-1]
+        nxt[:, :-1] |= frontier[:, 1:]
+        nxt &= garden
+        nxt &= ~reached
+        n = int(nxt.sum())
+        if n == 0:
+            break
+        reached |= nxt
+        frontier = nxt
+        counts.append(n)
+    return counts
+
+def step_counts_deque(grid, start, max_steps):
+    """Same as step_counts_numpy, via BFS over cells indexed by i * N + j."""
+    M = len(grid)
+    N = len(grid[0])
+    open_cell = [c in ".S" for row in grid for c in row]
+    dist = [-1] * (M * N)
+    s = start[0] * N + start[1]
+    dist[s] = 0
+    counts = [1]
+    queue = deque([s])
+    while queue:
+        k = queue.popleft()
+        d = dist[k] + 1
+        if d > max_steps:
+            break
+        i, j = divmod(k, N)
+        for kk, ok in ((k - N, i > 0), (k + N, i < M - 1),
+                       (k - 1, j > 0), (k + 1, j < N - 1)):
+            if ok and open_cell[kk] and dist[kk] < 0:
+                dist[kk] = d
+                if d == len(counts):
+                    counts.append(0)
+                counts[d] += 1
+                queue.append(kk)
+    return counts
+
+def step_counts(grid, start, max_steps):
+    if ENGINE == "deque":
+        return step_counts_deque(grid, start, max_steps)
+    else:
+        return step_counts_numpy(grid, start, max_steps)
+
+def reachable_plots_bounded(grid, start, target_steps):
+    """Returns (even, odd): plots reachable in exactly an even/odd number of steps <= target_steps."""
+    counts = step_counts(grid, start, target_steps)
+    return sum(counts[0::2]), sum(counts[1::2])
+
+def parity_prefix(counts):
+    """Cumulative histogram: prefix[d] = number of plots at distance <= d with parity d % 2."""
+    prefix = list(counts)
+    for d in range(2, len(prefix)):
+        prefix[d] += prefix[d - 2]
+    return prefix
+
+def plots_within(prefix, r):
+    """Plots at distance <= r with the same parity as r, in O(1)."""
+    if r < 0:
+        return 0
+    d = len(prefix) - 1
+    if r < d:
+        d = r
+    elif (d - r) % 2:
+        d -= 1
+    return prefix[d] if d >= 0 else 0
+
+def reachable_plots_tiled(grid, start, targets):
+    """Counts plots reachable in exactly t steps on the infinitely tiled grid, for each t in targets.
+
+    Assumes (like the real inputs) a square tile with S in the center and its row, column
+    and the tile border all open, so that every other tile is first entered at an edge
+    midpoint (tiles on the axes) or a corner (tiles in the quadrants).  Distances inside
+    such a tile are its entry distance plus a per-entry-point BFS distance, so only nine
+    BFSes over one tile are needed.
+    """
+    M = len(grid)
+    c = M // 2
+    assert start == (c, c)
+    assert all(grid[c][k] in ".S" and grid[k][c] in ".S" for k in range(M))
+    assert all(grid[0][k] == grid[M - 1][k] == grid[k][0] == grid[k][M - 1] == "."
+               for k in range(M))
+
+    center = parity_prefix(step_counts(grid, start, M * M))
+    axis_entries = [parity_prefix(step_counts(grid, e, M * M))
+                    for e in ((M - 1, c), (0, c), (c, M - 1), (c, 0))]
+    quadrant_entries = [parity_prefix(step_counts(grid, e, M * M))
+                        for e in ((M - 1, M - 1), (M - 1, 0), (0, M - 1), (0, 0))]
+
+    def _reachable(T):
+        total = plots_within(center, T)
+
+        # Axis tiles: the k-th tile out is entered at distance c + 1 + (k - 1) * M.
+        r1 = T - (c + 1)
+        for prefix in axis_entries:
+            if r1 < 0:
+                break
+            full = (plots_within(prefix, 2 * len(prefix)), plots_within(prefix, 2 * len(prefix) + 1))
+            # Tiles 1..k_full are completely within reach; their parity alternates with k.
+            k_full = max(0, (r1 - (len(prefix) - 1)) // M + 1)
+            total += (k_full + 1) // 2 * full[r1 % 2] + k_full // 2 * full[(r1 + 1) % 2]
+            k = k_full + 1
+            while (r := r1 - (k - 1) * M) >= 0:
+                total += plots_within(prefix, r)
+                k += 1
+
+        # Quadrant tiles: the s - 1 tiles with |u| + |v| == s are entered at distance
+        # 2 * (c + 1) + (s - 2) * M.
+        r2 = T - 2 * (c + 1)
+        for prefix in quadrant_entries:
+            if r2 < 0:
+                break
+            full = (plots_within(prefix, 2 * len(prefix)), plots_within(prefix, 2 * len(prefix) + 1))
+            t_full = max(0, (r2 - (len(prefix) - 1)) // M + 1)
+            odd_t = (t_full + 1) // 2
+            even_t = t_full // 2
+            total += odd_t * odd_t * full[r2 % 2] + even_t * (even_t + 1) * full[(r2 + 1) % 2]
+            t = t_full + 1
+            while (r := r2 - (t - 1) * M) >= 0:
+                total += t * plots_within(prefix, r)
+                t += 1
+
+        return total
+
+    return [_reachable(T) for T in targets]
+
 def main():
     inp = open(sys.argv[1])
     part1_steps = int(sys.argv[2])
-    part2_steps = int(sys.argv[3])
+    # Any number of part 2 step targets can follow; they share one search.
+    part2_targets = [int(arg) for arg in sys.argv[3:]]
 
     grid = [line.rstrip() for line in inp]
     M = len(grid)
@@ -29,40 +176,20 @@ def main():
                          for i in range(M)
                          if grid[i][j] == 'S'))
 
-    def _reachable_plots_bounded(target_steps):
-        def _adj(i, j):
-            if i > 0:
-                yield (i - 1, j)
-            if i < M - 1:
-                yield (i + 1, j)
-            if j > 0:
-                yield (i, j - 1)
-            if j < N - 1:
-                yield (i, j + 1)
-
-        step_dist = {}
-        queue = [(start, 0)]
-        while queue:
-            loc, d = queue.pop(0)
-            if d > target_steps:
-                break
-            if d >= step_dist.get(loc, 1000000):
-                continue
-            step_dist[loc] = d
-
-            i, j = loc
-            for ii, jj in _adj(i, j):
-                if grid[ii][jj] in ".S":
-                    queue.append(((ii, jj), d + 1))
-
-        reachable = 0
-        for (i, j), d in step_dist.items():
-            if d <= target_steps and d % 2 == 0:
-                reachable += 1
+    even, odd = reachable_plots_bounded(grid, start, part1_steps)
+    dprint(f"{even=} {odd=}")
+    print("Part 1:", odd if part1_steps % 2 else even)
 
-        return reachable
+    def _print_part2(answers):
+        if len(part2_targets) == 1:
+            print("Part 2:", answers[0])
+        else:
+            for t, a in zip(part2_targets, answers):
+                print(f"Part 2 ({t} steps):", a)
 
-    print("Part 1:", _reachable_plots_bounded(part1_steps))
+    if PART2 == "tiles":
+        _print_part2(reachable_plots_tiled(grid, start, part2_targets))
+        return
 
     # As BFS expands, eventually we get to a point where every plot has distance M=N greater
     # than the corresponding plots in the adjacent slices closer to the center.
@@ -76,7 +203,9 @@ def main():
     # We'll call the maximum distance of any point whose distance is not +M from its
     # counterpart the "maximum irregular radius".
 
-    P = part2_steps % (M * 2)
+    Ps = set(t % (M * 2) for t in part2_targets)
+    # Residues of 2M that must be seen beyond the irregular radius before stopping
+    pending = set((P + 1) % (M * 2) for P in Ps)
 
     def _adj(i, j):
         yield (i - 1, j)
@@ -121,8 +250,10 @@ def main():
             if grid[ii % M][jj % N] in ".S":
                 heapq.heappush(queue, (d + 1, (ii, jj)))
 
-        if d > max_irreg_dist + 2 * M and d % (2 * M) == (P + 1) % (2 * M):
-            break
+        if d > max_irreg_dist + 2 * M:
+            pending.discard(d % (2 * M))
+            if not pending:
+                break
 
     # Interlude: Visualize the distances.
     if (dist_file := os.environ.get("DISTFILE")):
@@ -166,18 +297,12 @@ def main():
                     _p()
                 _p()
 
-    def _plots_within_dist(d_max):
-        n = 0
-        for d in step_dist.values():
-            if  d <= d_max and d % 2 == part2_steps % 2:
-                n += 1
-        return n
-
     # First data point: first distance with the right parity outside the radius of irregularity
-    d1 = max(d for d in step_dist.values()
-             if d % (2 * M) == P)
-    a1 = _plots_within_dist(d1)
-    dprint(f"{d1=} {a1=}")
+    d1_for = {}
+    for d in step_dist.values():
+        P = d % (2 * M)
+        if P in Ps and d > d1_for.get(P, -1):
+            d1_for[P] = d
 
     # Keep expanding to collect enough data for the other data points.
     while queue:
@@ -196,27 +321,40 @@ def main():
             if grid[ii % M][jj % N] in ".S":
                 heapq.heappush(queue, (d + 1, (ii, jj)))
 
-        if d > d1 + 4 * M:
+        if d > max(d1_for.values()) + 4 * M:
             break
-        
-    # Second data point
-    d2 = d1 + 2 * M
-    a2 = _plots_within_dist(d2)
-    dprint(f"{d2=} {a2=}")
-
-    # Third data point
-    d3 = d2 + 2 * M
-    a3 = _plots_within_dist(d3)
-    dprint(f"{d3=} {a3=}")
-
-    dmat = numpy.array([[d1**2, d1, 1],
-                     [d2**2, d2, 1],
-                     [d3**2, d3, 1]])
-    avec = numpy.array([a1, a2, a3])
-    coeffs = numpy.linalg.solve(dmat, avec)
-    d = part2_steps
-    a = coeffs[0] * d**2 + coeffs[1] * d + coeffs[2]
-    print("Part 2:", a)
+
+    # Histogram of distances with per-parity cumulative counts, so each data point is O(1).
+    dist_counts = [0] * (max(step_dist.values()) + 1)
+    for d in step_dist.values():
+        dist_counts[d] += 1
+    dist_prefix = parity_prefix(dist_counts)
+
+    answers = []
+    for t in part2_targets:
+        d1 = d1_for[t % (2 * M)]
+        a1 = plots_within(dist_prefix, d1)
+        dprint(f"{d1=} {a1=}")
+
+        # Second data point
+        d2 = d1 + 2 * M
+        a2 = plots_within(dist_prefix, d2)
+        dprint(f"{d2=} {a2=}")
+
+        # Third data point
+        d3 = d2 + 2 * M
+        a3 = plots_within(dist_prefix, d3)
+        dprint(f"{d3=} {a3=}")
+
+        dmat = numpy.array([[d1**2, d1, 1],
+                         [d2**2, d2, 1],
+                         [d3**2, d3, 1]])
+        avec = numpy.array([a1, a2, a3])
+        coeffs = numpy.linalg.solve(dmat, avec)
+        d = t
+        a = coeffs[0] * d**2 + coeffs[1] * d + coeffs[2]
+        answers.append(a)
+    _print_part2(answers)
         
 main()
 
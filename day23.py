@@ -1,90 +1,106 @@
 #!/usr/bin/env python3
 
 import fileinput
+import multiprocessing
 import os
 import sys
 from pprint import pprint
 
-import copy
 import functools
 import heapq
-from collections import defaultdict
+from collections import deque
 from collections import namedtuple
 
-import cpmpy as cp
-
 DEBUG = os.environ.get("DEBUG", "")
 
+# Part 2 solver: "cp" builds a CPMpy model (needs OR-Tools, so no pypy);
+# "dfs" is a built-in branch-and-bound search over visited-node bitmasks;
+# "frontier" is a row-by-row DP over path connectivity states.
+ENGINE = os.environ.get("ENGINE", "cp")
+
+# Processes for ENGINE=dfs, and how many edges below start its search tree is
+# cut into subtrees for them.
+WORKERS = int(os.environ.get("WORKERS", "1"))
+SPLIT = int(os.environ.get("SPLIT", "6"))
+
 def dprint(*args):
     if DEBUG:
         print(*args)
 
-def main():
-    grid = [list(line.rstrip()) for line in fileinput.input()]
-    M = len(grid)
-    N = len(grid[0])
-
-    assert grid[0][1] == '.'
-    assert grid[M - 1][N - 2] == '.'
-    start = (0, 1)
-    end = (M - 1, N - 2)
-
-    def _adj(i, j):
-        if i > 0 and grid[i - 1][j] != '#' and grid[i][j] in '.^':
-            yield (i - 1, j)
-        if i < M - 1 and grid[i + 1][j] != '#' and grid[i][j] in '.v':
-            yield (i + 1, j)
-        if j > 0 and grid[i][j - 1] != '#' and grid[i][j] in '.<':
-            yield (i, j - 1)
-        if j < N - 1 and grid[i][j + 1] != '#' and grid[i][j] in '.>':
-            yield (i, j + 1)
-
-    # The slopes are always arranged in "gadgets" surrounding single "nexus"
-    # tiles.
-    # First step: Find the nexuses.
-    nexuses = set()
-    for i in range(M):
-        for j in range(N):
-            assert grid[i][j] not in '^<'
-
-            if grid[i][j] != '.':
-                continue
-            if not (0 < i < M - 1):
-                continue
-            if not (0 < j < N - 1):
+NexusGraph = namedtuple("NexusGraph", "pos downhill adj start end")
+
+def nexus_graph(lines):
+    """Compresses the maze into a NexusGraph.
+
+    Nodes are start (id 0), end (id 1) and every tile with three or more open
+    neighbours; pos[k] is node k's (row, column).  adj[u] lists (v, steps) for
+    each corridor at u, and downhill[u] only those that never climb a slope
+    going from u.  Each corridor is walked once, in O(M*N) overall.
+    """
+    n = len(lines[0])
+    # Walls padded around the flat grid keep every neighbour index in range.
+    w = n + 1
+    grid = ("#" * w + "".join(line + "#" for line in lines) + "#" * w).encode()
+    wall = ord("#")
+    moves = (-w, w, -1, 1)
+    # Tiles a move may leave from.
+    leave = {-w: b".^", w: b".v", -1: b".<", 1: b".>"}
+
+    start = w + 1
+    end = len(lines) * w + n - 2
+    assert grid[start] == grid[end] == ord(".")
+    node_id = {start: 0, end: 1}
+    pos = [None, None]
+    downhill = [[], []]
+    adj = [[], []]
+
+    # Nodes are found by the corridor walks themselves, and walked from in turn.
+    # walked holds (node, first tile) for corridors already walked from the far end.
+    walked = set()
+    q = deque([start, end])
+    while q:
+        k = q.popleft()
+        u = node_id[k]
+        pos[u] = (k // w - 1, k % w)
+        for m in moves:
+            if grid[k + m] == wall or (k, k + m) in walked:
                 continue
-            if grid[i - 1][j] == grid[i + 1][j] == 'v':
-                nexuses.add((i, j))
-            elif grid[i][j- 1] == grid[i][j + 1] == '>':
-                nexuses.add((i, j))
-    
-    # Construct an acyclic graph connecting:
-    # - the start point
-    # - the end point
-    # - the nexus points
-    # Each edge is labeled with the number of steps between the points it
-    # connects.
-    steps_from = defaultdict(list)
-    search_starts = [start]
-    while search_starts:
-        u = search_starts.pop(0)
-
-        steps = {u: 0}
-        q = [u]
-        while q:
-            v = q.pop(0)
-            for w in _adj(*v):
-                if w in steps:
-                    continue
-                steps[w] = 1 + steps[v]
-                if w in nexuses:
-                    steps_from[u].append((w, steps[w]))
-                    if w not in steps_from and w not in search_starts:
-                        search_starts.append(w)
-                elif w == end:
-                    steps_from[u].append((w, steps[w]))
-                else:
-                    q.append(w)
+            prev, cur, steps = k, k + m, 1
+            there = grid[k] in leave[m]
+            back = grid[cur] in leave[-m]
+            while cur not in node_id:
+                exits = [m for m in moves if cur + m != prev and grid[cur + m] != wall]
+                if len(exits) != 1:
+                    break
+                m = exits[0]
+                prev, cur, steps = cur, cur + m, steps + 1
+                there = there and grid[prev] in leave[m]
+                back = back and grid[cur] in leave[-m]
+            else:
+                exits = None
+            if exits == []:
+                continue  # Dead end
+            if exits:
+                node_id[cur] = len(node_id)
+                pos.append(None)
+                downhill.append([])
+                adj.append([])
+                q.append(cur)
+            v = node_id[cur]
+            walked.add((cur, prev))
+            adj[u].append((v, steps))
+            adj[v].append((u, steps))
+            if there:
+                downhill[u].append((v, steps))
+            if back:
+                downhill[v].append((u, steps))
+
+    return NexusGraph(pos, downhill, adj, 0, 1)
+
+def main():
+    g = nexus_graph([line.rstrip() for line in fileinput.input()])
+    start = g.start
+    end = g.end
 
     if (graph_file := os.environ.get("GRAPH")):
         with open(graph_file, "w") as f:
@@ -92,60 +108,65 @@ def main():
                 print(s, file=f)
 
             gpr("digraph {")
-            for u in steps_from:
-                i, j = u
-                for v, d in steps_from[u]:
-                    ii, jj = v
+            for u, out in enumerate(g.downhill):
+                i, j = g.pos[u]
+                for v, d in out:
+                    ii, jj = g.pos[v]
                     gpr(f'  x{i}_{j} -> x{ii}_{jj} [label="{d}"];')
             gpr("}")
 
+    # The slopes make the downhill graph acyclic.
     @functools.lru_cache(maxsize=None)
     def _max_steps_to_end_from(v):
         if v == end:
             return 0
 
         return max(d + _max_steps_to_end_from(w)
-                   for w, d in steps_from[v])
+                   for w, d in g.downhill[v])
 
     hike = _max_steps_to_end_from(start)
     print("Part 1:", hike)
 
     # Part 2: I can still use the graph between nexus points, but I need to
     # treat the edges as reversible.
+    adj = g.adj
 
-    # Add the reverse edges.
-    adj = copy.deepcopy(steps_from)
-    for u in steps_from:
-        for v, d in steps_from[u]:
-            adj[v].append((u, d))
+    if ENGINE == "dfs":
+        print("Part 2:", longest_hike_dfs(adj, start, end, WORKERS, SPLIT))
+        return
+    if ENGINE == "frontier":
+        print("Part 2:", longest_hike_frontier(adj, start, end))
+        return
+
+    import cpmpy as cp
 
     # The longest-path problem is NP-complete in general.
     # My attempts at a brute-force (backtracking) search were too slow
     # (how did others do it in under 60 seconds?)
     # so I'll use the big hammer: a constraint solver.
+    nodes = range(len(adj))
 
     # true if the point is visited by the path
     visited = {}
-    for v in steps_from:
+    for v in nodes:
         visited[v] = cp.boolvar(name=f"vis{v}")
-    visited[end] = cp.boolvar(name=f"vis{end}")
 
     # 1 if the edge is used, 0 if not
     edge = {}
-    for u in steps_from:
-        for v, _ in steps_from[u]:
+    for u in nodes:
+        for v, _ in g.downhill[u]:
             edge[(u, v)] = cp.intvar(0, 1, name=f"e{u}_{v}")
             edge[(v, u)] = cp.intvar(0, 1, name=f"e{v}_{u}")
 
     model = cp.Model()
 
     # Use each edge in at most one direction.
-    for u in steps_from:
-        for v, _ in steps_from[u]:
+    for u in nodes:
+        for v, _ in g.downhill[u]:
             model += (edge[(u, v)] + edge[(v, u)] <= 1)
 
     # Simple path: one edge in -> one edge out
-    for u in adj:
+    for u in nodes:
         ingress = [edge[(v, u)] for v, _ in adj[u]]
         egress = [edge[(u, v)] for v, _ in adj[u]]
 
@@ -166,10 +187,10 @@ def main():
 
     MAX_HOPS = len(edge) // 2
     hops = {}
-    for v in adj:
+    for v in nodes:
         hops[v] = cp.intvar(0, MAX_HOPS, name=f"hops{v}")
 
-    for v in adj:
+    for v in nodes:
         ingress = [edge[(u, v)] for u, _ in adj[v]]
         if len(ingress) == 0:
             model += (hops[v] == 0)
@@ -180,7 +201,7 @@ def main():
             model += (edge[(u, v)] == 1).implies(hops[v] == 1 + hops[u])
 
     obj = 0
-    for u in adj:
+    for u in nodes:
         for v, d in adj[u]:
             obj += d * edge[(u, v)]
     model.maximize(obj)
@@ -192,10 +213,237 @@ def main():
     else:
         print("Not solved")
 
-main()
+HikeGraph = namedtuple("HikeGraph", "nbrs top1 top2 goal goal_extra root")
+
+def hike_graph(adj, start, end):
+    """Returns the HikeGraph for the undirected nexus graph adj (as in NexusGraph).
+
+    Neighbour lists are sorted longest edge first, which finds good hikes early,
+    and each node gets its longest edge and the sum of its two longest edges.
+    root is the search state (node, visited bitmask, length, doubled bound) at
+    start.
+    """
+    nbrs = [sorted(vn, key=lambda x: -x[1]) for vn in adj]
+    top1 = []
+    top2 = []
+    for vn in nbrs:
+        ds = [d for _, d in vn] + [0, 0]
+        top1.append(ds[0])
+        top2.append(ds[0] + ds[1])
+    s = start
+    e = end
+
+    # If end is a dead end, reaching its one neighbour means walking straight to it;
+    # going anywhere else would block the way out.
+    if len(nbrs[e]) == 1:
+        goal, goal_extra = nbrs[e][0]
+        visited = (1 << s) | (1 << e)
+        rest2 = sum(top2) - top2[s] - top2[e]
+    else:
+        goal, goal_extra = e, 0
+        visited = 1 << s
+        rest2 = sum(top2) - top2[s]
+
+    return HikeGraph(nbrs, top1, top2, goal, goal_extra, (s, visited, 0, rest2))
+
+def _search_hikes(g, root, best=-1, shared=None):
+    """Best hike length through the search state root, or best if nothing beats it.
+
+    Every node the rest of a hike passes through is entered and left once, so the
+    rest is at most half the sum, over unvisited nodes, of their two longest edges
+    (rest2 is that sum).  Branches whose bound can't beat best are cut.
+
+    shared, if given, is a multiprocessing.Value holding the best length found by
+    any worker; improvements are published to it and it's re-read now and then.
+    """
+    nbrs, top1, top2, goal, goal_extra, _ = g
+    calls = 0
+
+    def _dfs(v, visited, length, rest2):
+        nonlocal best, calls
+        if v == goal:
+            if length + goal_extra > best:
+                best = length + goal_extra
+                dprint("best", best)
+                if shared is not None:
+                    with shared.get_lock():
+                        if best > shared.value:
+                            shared.value = best
+            return
+        if shared is not None:
+            calls += 1
+            if calls & 0xfff == 0 and shared.value > best:
+                best = shared.value
+        for w, d in nbrs[v]:
+            bit = 1 << w
+            if visited & bit:
+                continue
+            r2 = rest2 - top2[w]
+            if 2 * (length + d + goal_extra) + top1[w] + r2 <= 2 * best:
+                continue
+            _dfs(w, visited | bit, length + d, r2)
+
+    _dfs(*root)
+    return best
+
+def _split_hikes(g, root, depth):
+    """Returns (best finished hike length, search states depth edges below root)."""
+    nbrs, _, top2, goal, goal_extra, _ = g
+    best = -1
+    states = []
+    def _walk(v, visited, length, rest2, depth):
+        nonlocal best
+        if v == goal:
+            best = max(best, length + goal_extra)
+        elif depth == 0:
+            states.append((v, visited, length, rest2))
+        else:
+            for w, d in nbrs[v]:
+                if not visited & (1 << w):
+                    _walk(w, visited | (1 << w), length + d, rest2 - top2[w], depth - 1)
+    _walk(*root, depth)
+    return best, states
+
+_worker_graph = None
+_worker_best = None
+
+def _worker_init(g, shared):
+    global _worker_graph, _worker_best
+    _worker_graph = g
+    _worker_best = shared
+
+def _worker_search(root):
+    return _search_hikes(_worker_graph, root, _worker_best.value, _worker_best)
+
+def longest_hike_dfs(adj, start, end, workers=1, split_depth=6):
+    """Longest simple path from start to end over the undirected nexus graph adj.
+
+    With workers > 1, the search tree is cut split_depth edges below start and the
+    subtrees are searched in a process pool that shares the best length so far.
+    """
+    g = hike_graph(adj, start, end)
+    if workers <= 1:
+        return _search_hikes(g, g.root)
+
+    best, states = _split_hikes(g, g.root, split_depth)
+    dprint(len(states), "subtrees")
+    # The first subtree follows the longest edges; searching it up front gives the
+    # workers a good bound to cut against from the start.
+    if states:
+        best = _search_hikes(g, states.pop(0), best)
+    shared = multiprocessing.Value("q", best)
+    with multiprocessing.Pool(workers, initializer=_worker_init,
+                              initargs=(g, shared)) as pool:
+        for sub_best in pool.imap_unordered(_worker_search, states):
+            best = max(best, sub_best)
+    return best
+
+def longest_hike_frontier(adj, start, end):
+    """Longest simple path from start to end by frontier DP over the nexus graph adj.
+
+    The nexuses form a lattice, so they're swept in rows of equal hop distance
+    from start and edges are decided in that order.  Only the frontier, the
+    nexuses with edges both decided and pending, matters for the rest of the
+    sweep.  Its state is a mate array: a nexus maps to itself if unused, to -1
+    if it's inside the path, and to the far end of its path piece otherwise.
+    Each state keeps the best length that reaches it.
+    """
+    # Sweep order: rows of equal hop distance from start.
+    hops = {start: 0}
+    q = deque([start])
+    while q:
+        v = q.popleft()
+        for w, _ in adj[v]:
+            if w not in hops:
+                hops[w] = hops[v] + 1
+                q.append(w)
+    if end not in hops:
+        return -1
+    nodes = sorted(hops, key=lambda v: (hops[v], v))
+    index = {v: k for k, v in enumerate(nodes)}
+    s = index[start]
+    t = index[end]
+
+    back_edges = [[] for _ in nodes]
+    pending = [0] * len(nodes)
+    for v in nodes:
+        for w, d in adj[v]:
+            if index[w] < index[v]:
+                back_edges[index[v]].append((index[w], d))
+                pending[index[v]] += 1
+                pending[index[w]] += 1
+
+    best = -1
+    front = []
+    states = {(): 0}
+    for k in range(len(nodes)):
+        front.append(k)
+        states = {st + (k,): length for st, length in states.items()}
+
+        where = {v: i for i, v in enumerate(front)}
+        for u, d in back_edges[k]:
+            iu = where[u]
+            ik = where[k]
+            new_states = dict(states)
+            for st, length in states.items():
+                mu = st[iu]
+                mk = st[ik]
+                # No third edge at a nexus, no second edge at start or end, and no
+                # closing a piece into a loop.
+                if mu == -1 or mk == -1 or mu == k:
+                    continue
+                if (u in (s, t) and mu != u) or (k in (s, t) and mk != k):
+                    continue
+                mate = list(st)
+                if mu != u:
+                    mate[iu] = -1
+                if mk != k:
+                    mate[ik] = -1
+                if {mu, mk} == {s, t}:
+                    # The hike is done; it only counts if no other piece is open.
+                    if all(m in (-1, v) or v in (s, t) for v, m in zip(front, mate)):
+                        best = max(best, length + d)
+                    continue
+                if mu in where:
+                    mate[where[mu]] = mk
+                if mk in where:
+                    mate[where[mk]] = mu
+                mate = tuple(mate)
+                if new_states.get(mate, -1) < length + d:
+                    new_states[mate] = length + d
+            states = new_states
+            pending[u] -= 1
+            pending[k] -= 1
+
+        # Nexuses with no edges left drop out of the frontier.  A dangling piece
+        # end can never be closed, and start and end must have been used.
+        for i in reversed(range(len(front))):
+            v = front[i]
+            if pending[v]:
+                continue
+            new_states = {}
+            for st, length in states.items():
+                m = st[i]
+                if v in (s, t):
+                    if m == v:
+                        continue
+                elif m != v and m != -1:
+                    continue
+                key = st[:i] + st[i + 1:]
+                if new_states.get(key, -1) < length:
+                    new_states[key] = length
+            states = new_states
+            del front[i]
+        dprint("row", hops[nodes[k]], "frontier", len(front), "states", len(states))
+
+    return best
+
+if __name__ == "__main__":
+    main()
 
 # multitime -n 5 ; median:
 # cpython: 0.999s
 # pypy:    Didn't try
 # CPMpy wants OR-Tools, which doesn't work with pypy.
 # cpython runs it so fast that pypy isn't really interesting anyway.
+# ENGINE=dfs needs nothing outside the standard library, so it runs under pypy too.
@@ -5,18 +5,128 @@ import os
 import sys
 from pprint import pprint
 
+import heapq
+from collections import Counter
 from collections import defaultdict
 import random
 
-import networkx as nx
-
 DEBUG = os.environ.get("DEBUG", "")
 
+# "nx" retries networkx s-t cuts between random pairs until one has 3 edges;
+# "ni" finds the global minimum cut directly (Nagamochi-Ibaraki).
+ENGINE = os.environ.get("ENGINE", "nx")
+
 def dprint(*args):
     if DEBUG:
         print(*args)
 
+def min_cut(adj):
+    """Global minimum edge cut of the connected graph adj (neighbour id lists).
+
+    Returns (cut edges as (u, v) with u on the first side, (first side size,
+    second side size)).
+
+    Each phase scans the contracted graph in maximum adjacency order: next is
+    always the vertex most tightly attached to those already scanned.  The last
+    vertex's attachment is a cut (Stoer-Wagner's cut of the phase).  And no cut
+    lighter than q separates the ends of an edge that brought its far end's
+    attachment up to q (Nagamochi-Ibaraki), so every edge with q at least the
+    best cut so far gets contracted, along with the last two vertices.
+    """
+    n = len(adj)
+    nbrs = [Counter(vs) for vs in adj]
+    members = [[v] for v in range(n)]
+    parent = list(range(n))
+    alive = n
+
+    def _find(v):
+        while parent[v] != v:
+            parent[v] = parent[parent[v]]
+            v = parent[v]
+        return v
+
+    best = min(range(n), key=lambda v: len(adj[v]))
+    best_weight = len(adj[best])
+    best_side = [best]
+
+    phase = 0
+    while alive > 1:
+        phase += 1
+        attach = [0] * n
+        scanned = [False] * n
+        order = []
+        contract = []
+        heap = [(0, _find(0))]
+        while heap:
+            a, x = heapq.heappop(heap)
+            if scanned[x] or -a != attach[x]:
+                continue
+            scanned[x] = True
+            order.append(x)
+            for y, w in nbrs[x].items():
+                if not scanned[y]:
+                    attach[y] += w
+                    heapq.heappush(heap, (-attach[y], y))
+                    if attach[y] >= best_weight:
+                        contract.append((x, y))
+        assert len(order) == alive, "graph is not connected"
+
+        s, t = order[-2:]
+        if attach[t] < best_weight:
+            best_weight = attach[t]
+            best_side = list(members[t])
+        contract.append((s, t))
+        dprint(f"Phase {phase}: {alive} vertices, cut {attach[t]}, {len(contract)} to contract")
+
+        for x, y in contract:
+            x = _find(x)
+            y = _find(y)
+            if x == y:
+                continue
+            if len(nbrs[x]) < len(nbrs[y]):
+                x, y = y, x
+            # Merge y into x.
+            for z, w in nbrs[y].items():
+                del nbrs[z][y]
+                if z != x:
+                    nbrs[x][z] += w
+                    nbrs[z][x] += w
+            nbrs[y] = None
+            members[x] += members[y]
+            members[y] = None
+            parent[y] = x
+            alive -= 1
+
+    side = set(best_side)
+    cut = [(u, v) for u in best_side for v in adj[u] if v not in side]
+    return cut, (len(side), n - len(side))
+
 def main():
+    if ENGINE == "ni":
+        ids = {}
+        adj = []
+        def _id(name):
+            if name not in ids:
+                ids[name] = len(adj)
+                adj.append([])
+            return ids[name]
+
+        for line in fileinput.input():
+            u, vs = line.split(':')
+            for v in vs.split():
+                i = _id(u)
+                j = _id(v)
+                adj[i].append(j)
+                adj[j].append(i)
+
+        cutset, comp_sizes = min_cut(adj)
+        names = list(ids)
+        dprint("Cut:", [(names[u], names[v]) for u, v in cutset])
+        print("Part 1:", comp_sizes[0] * comp_sizes[1])
+        return
+
+    import networkx as nx
+
     graph = nx.Graph()
 
     for line in fileinput.input():